@@ -1,171 +1,479 @@
 from flask import Flask, request, render_template, jsonify
-import pandas as pd
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import RequestEntityTooLarge
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import atexit
+import csv
+import hashlib
 import io
 import json
+import sqlite3
+import threading
 import xml.etree.ElementTree as ET
 import base64
 import os # To check file extensions
 
+try:
+    import ijson # Optional: streams JSON so only the first record is parsed
+except ImportError:
+    ijson = None
+
+try:
+    import orjson # Optional: faster request/response JSON
+except ImportError:
+    orjson = None
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, used by request.get_json() and jsonify()."""
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_SORT_KEYS if self.sort_keys else 0
+        if kwargs.get('indent'): # jsonify pretty-prints in debug mode
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+# Request bodies above this are rejected with 413 before any file is read or decoded
+app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 
 # --- Schema Parsing & Normalization Logic ---
 
+# Spaces and underscores are dropped when normalizing column names.
+_SEPARATOR_TABLE = str.maketrans('', '', ' _')
+# Same as above, but also folds A-Z to lowercase so ASCII names need only one pass.
+_ASCII_NORM_TABLE = str.maketrans({' ': None, '_': None,
+                                   **{c: c + 32 for c in range(ord('A'), ord('Z') + 1)}})
+
 def normalize_name(name):
     """Normalize a column name for comparison."""
-    # Ensure it's a string before calling .strip()
-    if not isinstance(name, str):
-        name = str(name)
-    return name.strip().lower().replace(" ", "").replace("_", "")
-
-def infer_schema_from_csv_content(csv_content_str):
-    """Infers schema from CSV content string using pandas."""
-    if not csv_content_str.strip():
-        return []
     try:
-        # pd.read_csv needs a file-like object or path
-        df = pd.read_csv(io.StringIO(csv_content_str))
-        return [normalize_name(col) for col in df.columns.tolist()]
-    except pd.errors.EmptyDataError:
+        name = name.strip()
+    except AttributeError: # Not a string (e.g. a numeric header cell)
+        name = str(name).strip()
+    if name.isascii():
+        return name.translate(_ASCII_NORM_TABLE)
+    # Non-ASCII names still need full Unicode case folding
+    return name.lower().translate(_SEPARATOR_TABLE)
+
+def memoized_normalizer():
+    """
+    Returns a normalize_name equivalent that remembers its results, so column
+    names shared by both files of a request are only normalized once.
+    """
+    memo = {}
+    def normalize(name):
+        try:
+            return memo[name]
+        except KeyError:
+            normalized = memo[name] = normalize_name(name)
+            return normalized
+    return normalize
+
+def infer_schema_from_csv_content(csv_content, normalizer=normalize_name):
+    """
+    Infers schema from the header row of CSV content (a string, or UTF-8 bytes).
+    Returns None if the content can't be parsed.
+    """
+    if not csv_content or csv_content.isspace():
         return []
-    except Exception as e:
+    if isinstance(csv_content, bytes):
+        # Decoded incrementally, so only the chunk holding the header row is decoded
+        csv_stream = io.TextIOWrapper(io.BytesIO(csv_content), encoding='utf-8-sig',
+                                      errors='replace', newline='')
+    else:
+        csv_stream = io.StringIO(csv_content)
+    try:
+        # Only the header row is needed, so stop at the first non-blank record
+        header = next((row for row in csv.reader(csv_stream) if row), [])
+        # Blank header cells are skipped, as they are for XLSX
+        return [normalizer(col) for col in header if col.strip()]
+    except csv.Error as e:
         print(f"Error inferring CSV schema: {e}")
-        return []
+        return None
 
-def infer_schema_from_json_content(json_content_str):
-    """Infers schema from JSON content string (top-level keys of first object/array element)."""
-    if not json_content_str.strip():
+def _stream_json_top_level_keys(json_stream):
+    """
+    Returns the keys of the top-level object (or of the first element of a
+    top-level array) read from a binary stream with ijson, stopping as soon
+    as that object ends.
+    """
+    keys = []
+    depth = 0
+    key_depth = None
+    for _, event, value in ijson.parse(json_stream):
+        if key_depth is None:
+            if event == 'start_map':
+                key_depth = depth + 1
+            elif not (event == 'start_array' and depth == 0):
+                return [] # Unhandled JSON structure (e.g., list of primitives)
+        elif event == 'map_key' and depth == key_depth:
+            keys.append(value)
+        elif event == 'end_map' and depth == key_depth:
+            break
+        if event in ('start_map', 'start_array'):
+            depth += 1
+        elif event in ('end_map', 'end_array'):
+            depth -= 1
+    # Repeated keys collapse to one, as they would with json.loads
+    return list(dict.fromkeys(keys))
+
+def infer_schema_from_json_content(json_content, normalizer=normalize_name):
+    """
+    Infers schema from JSON content, a string or UTF-8 bytes (top-level keys of
+    first object/array element). Returns None if the content can't be parsed.
+    """
+    if not json_content or json_content.isspace():
         return []
+    if ijson is not None:
+        if isinstance(json_content, str):
+            json_stream = io.BytesIO(json_content.encode('utf-8'))
+        else:
+            # Streamed as-is; only the bytes up to the end of the first record are read
+            json_stream = io.BytesIO(json_content)
+            if json_content.startswith(b'\xef\xbb\xbf'):
+                json_stream.seek(3) # Skip the UTF-8 BOM without copying the content
+        try:
+            keys = _stream_json_top_level_keys(json_stream)
+            return [normalizer(key) for key in keys]
+        except (ijson.JSONError, UnicodeDecodeError):
+            pass # Let json.loads below report the error
+    if isinstance(json_content, bytes):
+        json_content = json_content.decode('utf-8-sig', errors='replace')
     try:
-        data = json.loads(json_content_str)
+        data = json.loads(json_content)
         if isinstance(data, list) and len(data) > 0 and isinstance(data[0], dict):
             # List of objects, infer from first object
-            return [normalize_name(key) for key in data[0].keys()]
+            return [normalizer(key) for key in data[0].keys()]
         elif isinstance(data, dict):
             # Single object
-            return [normalize_name(key) for key in data.keys()]
+            return [normalizer(key) for key in data.keys()]
         else:
             return [] # Unhandled JSON structure (e.g., list of primitives)
     except json.JSONDecodeError:
         print("Error: Invalid JSON content.")
-        return []
+        return None
     except Exception as e:
         print(f"Error inferring JSON schema: {e}")
-        return []
+        return None
 
-def infer_schema_from_xlsx_content(file_content_bytes):
-    """Infers schema from XLSX content bytes using pandas."""
+def infer_schema_from_xlsx_content(file_content_bytes, normalizer=normalize_name):
+    """
+    Infers schema from the first row of the active sheet in XLSX content bytes.
+    Returns None if the workbook can't be read (including openpyxl being unavailable).
+    """
     if not file_content_bytes:
         return []
     try:
-        # pd.read_excel needs a file-like object or path
-        df = pd.read_excel(io.BytesIO(file_content_bytes))
-        return [normalize_name(col) for col in df.columns.tolist()]
+        from openpyxl import load_workbook # Imported lazily to keep worker startup fast
+
+        # read_only streams the sheet XML, so only the header row's cells get parsed
+        wb = load_workbook(io.BytesIO(file_content_bytes), read_only=True, data_only=True)
+        try:
+            header = next(wb.active.iter_rows(min_row=1, max_row=1, values_only=True), ())
+        finally:
+            wb.close()
+        return [normalizer(str(cell)) for cell in header if cell is not None]
     except Exception as e:
         print(f"Error inferring XLSX schema: {e}")
-        return []
+        return None
+
+# lxml.etree once resolved on first XML parse, False if it isn't installed
+_lxml_etree = None
+
+def iterparse_xml(source, events):
+    """
+    iterparse via lxml when it is installed (imported on first use), otherwise
+    via the stdlib xml.etree, which accepts the same events.
+    """
+    global _lxml_etree
+    if _lxml_etree is None:
+        try:
+            from lxml import etree as _lxml_etree
+        except ImportError:
+            _lxml_etree = False
+    if not _lxml_etree:
+        return ET.iterparse(source, events=events)
+    # Never fetch or expand external entities from uploaded documents
+    return _lxml_etree.iterparse(source, events=events, resolve_entities=False, no_network=True)
 
-def infer_schema_from_xml_content(xml_content_str):
+def infer_schema_from_xml_content(xml_content, normalizer=normalize_name):
     """
-    Infers schema from XML content string.
-    Simplistic: takes top-level unique tags directly under the root.
+    Infers schema from XML content (a string, or raw bytes whose encoding the
+    parser detects from the BOM/XML declaration).
+    Simplistic: takes top-level unique tags directly under the root, in document order.
+    Returns None if the content can't be parsed.
     """
-    if not xml_content_str.strip():
+    if not xml_content or xml_content.isspace():
         return []
     try:
-        root = ET.fromstring(xml_content_str)
-        schema_fields = sorted(list(set([elem.tag for elem in root])))
-        return [normalize_name(f) for f in schema_fields]
-    except ET.ParseError:
+        # Stream the document and drop each top-level element once it ends, so
+        # memory stays bounded by the largest single child of the root
+        tags = {} # Insertion-ordered set
+        depth = 0
+        root = None
+        if isinstance(xml_content, str):
+            xml_content = xml_content.encode('utf-8')
+        xml_stream = io.BytesIO(xml_content)
+        for event, elem in iterparse_xml(xml_stream, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                if depth == 1:
+                    root = elem
+                elif depth == 2:
+                    tags[elem.tag] = None
+            else:
+                if depth == 2:
+                    # Clearing alone would leave an empty shell attached per record;
+                    # elem is the root's only child at this point, so removal is cheap
+                    elem.clear()
+                    root.remove(elem)
+                depth -= 1
+        return [normalizer(tag) for tag in tags]
+    except SyntaxError: # Base of both xml.etree's and lxml's ParseError
         print("Error: Invalid XML content.")
-        return []
+        return None
     except Exception as e:
         print(f"Error inferring XML schema: {e}")
-        return []
+        return None
 
+# Schema inferrers by file extension; each takes (file_bytes, normalizer) and returns None on failure
+INFERRERS = {
+    '.csv': lambda file_bytes, normalizer: infer_schema_from_csv_content(
+        file_bytes, normalizer=normalizer),
+    '.json': lambda file_bytes, normalizer: infer_schema_from_json_content(
+        file_bytes, normalizer=normalizer),
+    '.xlsx': lambda file_bytes, normalizer: infer_schema_from_xlsx_content(
+        file_bytes, normalizer=normalizer),
+    '.xml': lambda file_bytes, normalizer: infer_schema_from_xml_content(
+        file_bytes, normalizer=normalizer),
+}
 
 def match_schemas(schema_a_fields, schema_b_fields):
     """
     Matches two lists of normalized schema fields.
-    Returns matches and unmapped fields.
-    """
-    matches = []
-    # Create copies to safely remove elements during matching
-    unmatched_a = list(schema_a_fields)
-    unmatched_b = list(schema_b_fields)
-
-    # Exact Match
-    for field_a in schema_a_fields:
-        if field_a in unmatched_b:
-            matches.append((field_a, field_a)) # Store original names or normalized? For simplicity, normalized.
-            unmatched_a.remove(field_a)
-            unmatched_b.remove(field_a)
+    Returns matches and unmapped fields. Each list keeps the order in which
+    fields first appear in its source schema (matches follow schema A).
+    """
+    # dicts double as insertion-ordered sets: O(n) dedup without sorting
+    fields_a = dict.fromkeys(schema_a_fields)
+    fields_b = dict.fromkeys(schema_b_fields)
+
     return {
-        "matches": matches,
-        "unmatched_a": unmatched_a,
-        "unmatched_b": unmatched_b
+        "matches": [(field, field) for field in fields_a if field in fields_b], # Exact match on normalized names
+        "unmatched_a": [field for field in fields_a if field not in fields_b],
+        "unmatched_b": [field for field in fields_b if field not in fields_a]
     }
 
+# --- Schema Cache ---
+
+# Inferred schemas keyed by file content hash, so re-uploading a file skips parsing.
+# Lives in the Flask instance folder; one connection per process, shared behind a lock.
+# Bump SCHEMA_CACHE_VERSION whenever inference results change, so stale entries are dropped.
+SCHEMA_CACHE_VERSION = 2
+SCHEMA_CACHE_TABLE = f'schemas_v{SCHEMA_CACHE_VERSION}'
+SCHEMA_CACHE_MAX_ENTRIES = 10000
+_schema_cache = None
+_schema_cache_lock = threading.Lock()
+
+def _schema_cache_db():
+    """
+    Returns the process's cache connection, opening it on first use so each
+    forked WSGI worker gets its own. Callers must hold _schema_cache_lock.
+    """
+    global _schema_cache
+    if _schema_cache is None:
+        os.makedirs(app.instance_path, exist_ok=True)
+        db = sqlite3.connect(os.path.join(app.instance_path, 'schema_cache.db'),
+                             check_same_thread=False)
+        db.execute(f'CREATE TABLE IF NOT EXISTS {SCHEMA_CACHE_TABLE} (hash TEXT PRIMARY KEY, cols TEXT)')
+        # Drop tables left by older cache versions (including the unversioned 'schemas')
+        stale_tables = db.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                  "AND name LIKE 'schemas%' AND name != ?",
+                                  (SCHEMA_CACHE_TABLE,)).fetchall()
+        for (table,) in stale_tables:
+            db.execute(f'DROP TABLE IF EXISTS "{table}"')
+        db.commit()
+        _schema_cache = db
+    return _schema_cache
+
+def schema_cache_key(file_bytes, file_extension):
+    """Cache key for a file: SHA-256 of its content plus the extension used to parse it."""
+    return hashlib.sha256(file_bytes).hexdigest() + file_extension
+
+# Most recently used schemas, checked before SQLite; holds only keys and field tuples
+_MEMORY_CACHE_SIZE = 256
+_memory_cache = OrderedDict()
+_memory_cache_lock = threading.Lock()
+
+def get_memory_cached_schema(cache_key):
+    """Returns the schema fields for cache_key from the in-process LRU, or None on a miss."""
+    with _memory_cache_lock:
+        schema_fields = _memory_cache.get(cache_key)
+        if schema_fields is None:
+            return None
+        _memory_cache.move_to_end(cache_key)
+    return list(schema_fields)
+
+def memory_cache_schema(cache_key, schema_fields):
+    """Stores schema fields in the in-process LRU, evicting the least recently used entry."""
+    with _memory_cache_lock:
+        _memory_cache[cache_key] = tuple(schema_fields) # Immutable, so callers can't alter cached entries
+        _memory_cache.move_to_end(cache_key)
+        if len(_memory_cache) > _MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+def get_cached_schema(cache_key):
+    """Returns the cached schema fields for cache_key, or None on a miss."""
+    try:
+        with _schema_cache_lock:
+            row = _schema_cache_db().execute(f'SELECT cols FROM {SCHEMA_CACHE_TABLE} WHERE hash = ?',
+                                             (cache_key,)).fetchone()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Error reading schema cache: {e}")
+        return None
+    return json.loads(row[0]) if row else None
+
+def cache_schema(cache_key, schema_fields):
+    """
+    Stores inferred schema fields under cache_key, evicting the oldest entries
+    once the table holds more than SCHEMA_CACHE_MAX_ENTRIES.
+    """
+    try:
+        with _schema_cache_lock:
+            db = _schema_cache_db()
+            db.execute(f'INSERT OR REPLACE INTO {SCHEMA_CACHE_TABLE} (hash, cols) VALUES (?, ?)',
+                       (cache_key, json.dumps(schema_fields)))
+            # Each (re)insert gets a higher rowid, so the lowest rowids are the oldest entries
+            db.execute(f'DELETE FROM {SCHEMA_CACHE_TABLE} '
+                       f'WHERE rowid <= (SELECT MAX(rowid) FROM {SCHEMA_CACHE_TABLE}) - ?',
+                       (SCHEMA_CACHE_MAX_ENTRIES,))
+            db.commit()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Error writing schema cache: {e}")
+
 # --- Flask Routes ---
 
+# Shared by all requests to parse uploaded files in parallel; threads start on first use
+EXECUTOR = ThreadPoolExecutor(max_workers=4)
+atexit.register(EXECUTOR.shutdown)
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def read_uploaded_file(side):
+    """
+    Returns (file_bytes, file_name) for file 'a' or 'b' of the current request,
+    or None if the request doesn't include that file at all. Multipart uploads
+    are read directly; JSON bodies with base64 content are still accepted for
+    older clients.
+    """
+    upload = request.files.get(f'file_{side}')
+    if upload is not None:
+        return upload.read(), upload.filename or ''
+    # A malformed JSON body raises here, so the caller reports it as a bad request
+    data = request.get_json() if request.is_json else {}
+    if f'file_{side}_base64' not in data:
+        return None
+    file_base64 = data[f'file_{side}_base64']
+    file_bytes = base64.b64decode(file_base64) if file_base64 else b''
+    return file_bytes, data.get(f'file_{side}_name', '')
+
+def detect_file_extension(file_bytes, file_name):
+    """
+    Returns the INFERRERS key to parse an upload with, or None if it can't be
+    parsed. ZIP content is always treated as XLSX. Extensionless uploads are
+    sniffed from their first bytes (XML, JSON, else CSV); an .xlsx that isn't a
+    ZIP is only accepted if it is clearly XML or JSON, so binary files such as
+    legacy .xls workbooks are rejected. Otherwise the extension is trusted.
+    """
+    if file_bytes.startswith(b'PK\x03\x04'): # ZIP local file header
+        return '.xlsx'
+    _, file_extension = os.path.splitext(file_name.lower())
+    if file_extension in ('', '.xlsx'):
+        head = file_bytes[:64].removeprefix(b'\xef\xbb\xbf').lstrip()
+        if head.startswith(b'<'):
+            return '.xml'
+        if head.startswith((b'{', b'[')):
+            return '.json'
+        return '.csv' if file_extension == '' else None
+    return file_extension
+
+def infer_file_schema(file_bytes, file_name, normalizer=normalize_name):
+    """Infers the normalized schema of one uploaded file, going through the schema cache."""
+    if not file_bytes:
+        return []
+    file_extension = detect_file_extension(file_bytes, file_name)
+    infer = INFERRERS.get(file_extension)
+    if infer is None:
+        print(f"Unsupported or unrecognized file type for {file_name}")
+        return []
+
+    cache_key = schema_cache_key(file_bytes, file_extension)
+    schema_fields = get_memory_cached_schema(cache_key)
+    if schema_fields is not None:
+        return schema_fields
+    schema_fields = get_cached_schema(cache_key)
+    if schema_fields is None:
+        schema_fields = infer(file_bytes, normalizer)
+        if schema_fields is None:
+            return [] # Parse failed: report no fields, but never cache the failure
+        cache_schema(cache_key, schema_fields)
+    memory_cache_schema(cache_key, schema_fields)
+    return schema_fields
+
 @app.route('/match', methods=['POST'])
 def perform_match():
-    data = request.json
-    file_a_base64 = data.get('file_a_base64', '')
-    file_a_name = data.get('file_a_name', '')
-    file_b_base64 = data.get('file_b_base64', '')
-    file_b_name = data.get('file_b_name', '')
-
-    parsed_schema_a = []
-    parsed_schema_b = []
+    # Reject empty and oversized bodies up front, before any parsing or base64 decoding
+    content_length = request.content_length # None for chunked bodies
+    if content_length == 0:
+        return jsonify({"error": "No files were uploaded."}), 400
+    if content_length is not None and content_length > app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({"error": "Uploaded files are too large."}), 413
 
-    # Process File A
-    if file_a_base64:
+    uploads = {}
+    for side in ('a', 'b'):
         try:
-            file_a_bytes = base64.b64decode(file_a_base64)
-            _, file_a_extension = os.path.splitext(file_a_name.lower())
-
-            if file_a_extension == '.csv':
-                parsed_schema_a = infer_schema_from_csv_content(file_a_bytes.decode('utf-8'))
-            elif file_a_extension == '.json':
-                parsed_schema_a = infer_schema_from_json_content(file_a_bytes.decode('utf-8'))
-            elif file_a_extension == '.xlsx':
-                parsed_schema_a = infer_schema_from_xlsx_content(file_a_bytes)
-            elif file_a_extension == '.xml':
-                parsed_schema_a = infer_schema_from_xml_content(file_a_bytes.decode('utf-8'))
-            else:
-                print(f"Unsupported file type for Schema A: {file_a_extension}")
+            upload = read_uploaded_file(side)
+        except RequestEntityTooLarge: # Body without a Content-Length that hit the limit
+            return jsonify({"error": "Uploaded files are too large."}), 413
         except Exception as e:
-            print(f"Error processing file A: {e}")
-            return jsonify({"error": f"Could not process file A: {e}"}), 400
+            print(f"Error processing file {side.upper()}: {e}")
+            return jsonify({"error": f"Could not process file {side.upper()}: {e}"}), 400
+        if upload is not None:
+            uploads[side] = upload
+    # Empty files are still matched (yielding no fields); only a request without any file is rejected
+    if not uploads:
+        return jsonify({"error": "No files were uploaded."}), 400
+    for side in ('a', 'b'):
+        uploads.setdefault(side, (b'', ''))
 
-    # Process File B
-    if file_b_base64:
+    # Shared by both files, which usually have many column names in common
+    normalize = memoized_normalizer()
+    parsed_schemas = {}
+    # The two files are independent, so parse them concurrently
+    futures = {side: EXECUTOR.submit(infer_file_schema, file_bytes, file_name, normalize)
+               for side, (file_bytes, file_name) in uploads.items()}
+    for side, future in futures.items():
         try:
-            file_b_bytes = base64.b64decode(file_b_base64)
-            _, file_b_extension = os.path.splitext(file_b_name.lower())
-
-            if file_b_extension == '.csv':
-                parsed_schema_b = infer_schema_from_csv_content(file_b_bytes.decode('utf-8'))
-            elif file_b_extension == '.json':
-                parsed_schema_b = infer_schema_from_json_content(file_b_bytes.decode('utf-8'))
-            elif file_b_extension == '.xlsx':
-                parsed_schema_b = infer_schema_from_xlsx_content(file_b_bytes)
-            elif file_b_extension == '.xml':
-                parsed_schema_b = infer_schema_from_xml_content(file_b_bytes.decode('utf-8'))
-            else:
-                print(f"Unsupported file type for Schema B: {file_b_extension}")
+            parsed_schemas[side] = future.result()
         except Exception as e:
-            print(f"Error processing file B: {e}")
-            return jsonify({"error": f"Could not process file B: {e}"}), 400
+            print(f"Error processing file {side.upper()}: {e}")
+            return jsonify({"error": f"Could not process file {side.upper()}: {e}"}), 400
 
-    results = match_schemas(parsed_schema_a, parsed_schema_b)
+    results = match_schemas(parsed_schemas['a'], parsed_schemas['b'])
     return jsonify(results)
 
 if __name__ == '__main__':
-    app.run(debug=True) # Run in debug mode for development
+    # Single-process development server. In production, serve the app with a
+    # WSGI server so requests are parsed in parallel across cores, e.g.:
+    #   gunicorn app:app -w $(nproc) -k gthread --threads 4
+    app.run()
 
     
\ No newline at end of file